@@ -23,6 +23,20 @@ def create_app():
     app.config['MYSQL_DB'] = os.getenv('DB_NAME')
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
+    # How long Idempotency-Key responses are kept for replay
+    app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+    # Alert email notifications (disabled unless SMTP_HOST is set)
+    app.config['SMTP_HOST'] = os.getenv('SMTP_HOST')
+    app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', 25))
+    app.config['SMTP_USER'] = os.getenv('SMTP_USER')
+    app.config['SMTP_PASSWORD'] = os.getenv('SMTP_PASSWORD')
+    app.config['ALERT_EMAIL_FROM'] = os.getenv('ALERT_EMAIL_FROM', 'inventory@localhost')
+    app.config['ALERT_DIGEST_DELAY'] = int(os.getenv('ALERT_DIGEST_DELAY', 60))
+    app.config['ALERT_EMAIL_TO'] = [
+        email.strip() for email in os.getenv('ALERT_EMAIL_TO', '').split(',') if email.strip()
+    ]
+
     # ADD THESE SESSION CONFIGS
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     app.config['SESSION_COOKIE_SECURE'] = False
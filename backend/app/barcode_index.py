@@ -0,0 +1,28 @@
+# app/barcode_index.py
+
+import threading
+
+
+class BarcodeIndex:
+    """In-memory barcode -> product_id map so scans resolve without a DB read.
+
+    Each worker process has its own copy. `version` is the BarcodeIndexVersion
+    value it was loaded at; callers reload when the DB version moves on.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._lock = threading.Lock()
+        self.version = None
+
+    def load(self, rows, version):
+        codes = {barcode: product_id for barcode, product_id in rows}
+        with self._lock:
+            self._codes = codes
+            self.version = version
+
+    def get(self, barcode):
+        return self._codes.get(barcode)
+
+
+barcode_index = BarcodeIndex()
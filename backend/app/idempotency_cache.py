@@ -0,0 +1,43 @@
+# app/idempotency_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Bounded LRU of (user_id, endpoint, key) -> (request_hash, status, body)
+    for recent write responses. Each entry expires when its DB row does.
+
+    The IdempotencyKeys table is the source of truth; this only lets repeated
+    retries be answered without a DB round trip.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if time.monotonic() >= expires_at:
+                del self._responses[key]
+                return None
+            self._responses.move_to_end(key)
+            return response
+
+    def put(self, key, response, ttl_seconds):
+        if ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._responses[key] = (time.monotonic() + ttl_seconds, response)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+
+
+idempotency_cache = IdempotencyCache()
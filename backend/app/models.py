@@ -3,12 +3,146 @@
 
 # app/models.py
 
-def get_all_products(mysql):
+from datetime import datetime, timedelta
+from MySQLdb import IntegrityError
+
+
+# Shared list-query builder. A spec whitelists what clients may name in the
+# query string; only whitelisted SQL is ever interpolated and every value is
+# bound as a parameter.
+#
+#   'from'     FROM clause (with joins)
+#   'select'   default select list, used when ?fields= is absent
+#   'columns'  public name -> SQL expression, for ?fields= and ?sort=
+#   'filters'  public name -> SQL expression, for ?name=value equality
+#   'booleans' public name -> SQL expression, for ?name=true|false
+#   'flags'    public name -> SQL condition, applied (or negated) by ?name=true|false
+#   'dates'    public name -> SQL expression, for ?name_from= / ?name_to=
+#   'order'    default ORDER BY, used when ?sort= is absent
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+def parse_bool(name, value):
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError("Invalid boolean for '%s': %s" % (name, value))
+
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M')
+
+def parse_date(name, value):
+    # Returns (datetime, is_date_only). Only plain YYYY-MM-DD and
+    # YYYY-MM-DD[T ]HH:MM[:SS] are accepted, so what MySQL compares against
+    # is exactly what was validated.
+    try:
+        return datetime.strptime(value, DATE_FORMAT), True
+    except ValueError:
+        pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt), False
+        except ValueError:
+            pass
+    raise ValueError("Invalid date for '%s': %s" % (name, value))
+
+def build_list_query(spec, args):
+    columns = spec['columns']
+    where = []
+    params = []
+
+    for name, expr in spec.get('filters', {}).items():
+        if name in args:
+            where.append(expr + " = %s")
+            params.append(args[name])
+
+    for name, expr in spec.get('booleans', {}).items():
+        if name in args:
+            where.append(expr + " = %s")
+            params.append(parse_bool(name, args[name]))
+
+    for name, condition in spec.get('flags', {}).items():
+        if name in args:
+            where.append(condition if parse_bool(name, args[name]) else "NOT (" + condition + ")")
+
+    for name, expr in spec.get('dates', {}).items():
+        if name + '_from' in args:
+            value, _ = parse_date(name + '_from', args[name + '_from'])
+            where.append(expr + " >= %s")
+            params.append(value)
+        if name + '_to' in args:
+            value, date_only = parse_date(name + '_to', args[name + '_to'])
+            if date_only:
+                # A bare date includes the whole day
+                where.append(expr + " < %s")
+                params.append(value + timedelta(days=1))
+            else:
+                where.append(expr + " <= %s")
+                params.append(value)
+
+    fields = args.get('fields')
+    if fields:
+        select = []
+        for field in fields.split(','):
+            field = field.strip()
+            if field not in columns:
+                raise ValueError("Unknown field: %s" % field)
+            select.append(columns[field])
+        select = ', '.join(select)
+    else:
+        select = spec['select']
+
+    sql = "SELECT " + select + " FROM " + spec['from']
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    sort = args.get('sort')
+    if sort:
+        order = []
+        for field in sort.split(','):
+            field = field.strip()
+            direction = 'DESC' if field.startswith('-') else 'ASC'
+            field = field.lstrip('-')
+            if field not in columns:
+                raise ValueError("Unknown sort field: %s" % field)
+            order.append(columns[field] + " " + direction)
+        sql += " ORDER BY " + ", ".join(order)
+    elif spec.get('order'):
+        sql += " ORDER BY " + spec['order']
+
+    return sql, tuple(params)
+
+def query_list(mysql, spec, args=None):
+    sql, params = build_list_query(spec, args or {})
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Products")
-    products = cursor.fetchall()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
     cursor.close()
-    return products
+    return rows
+
+
+PRODUCT_LIST = {
+    'from': "Products",
+    'select': "*",
+    'columns': {
+        'product_id': "product_id",
+        'product_name': "product_name",
+        'description': "description",
+        'category': "category",
+        'price': "price",
+        'supplier_id': "supplier_id",
+    },
+    'filters': {
+        'category': "category",
+        'supplier_id': "supplier_id",
+    },
+}
+
+def get_all_products(mysql, args=None):
+    return query_list(mysql, PRODUCT_LIST, args)
 
 def create_product(mysql, product):
     cursor = mysql.connection.cursor()
@@ -44,18 +178,30 @@ def update_product(mysql, product_id, product):
 def delete_product(mysql, product_id):
     cursor = mysql.connection.cursor()
     cursor.execute("DELETE FROM Products WHERE product_id=%s", (product_id,))
+    # The product's barcodes go with it (ON DELETE CASCADE)
+    bump_barcode_version(cursor)
     mysql.connection.commit()
     cursor.close()
 
 
 # app/models.py
 
-def get_all_suppliers(mysql):
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT * FROM Suppliers")
-    suppliers = cursor.fetchall()
-    cursor.close()
-    return suppliers
+SUPPLIER_LIST = {
+    'from': "Suppliers",
+    'select': "*",
+    'columns': {
+        'supplier_id': "supplier_id",
+        'supplier_name': "supplier_name",
+        'contact_email': "contact_email",
+        'phone_number': "phone_number",
+    },
+    'filters': {
+        'supplier_name': "supplier_name",
+    },
+}
+
+def get_all_suppliers(mysql, args=None):
+    return query_list(mysql, SUPPLIER_LIST, args)
 
 def create_supplier(mysql, supplier):
     cursor = mysql.connection.cursor()
@@ -92,16 +238,34 @@ def delete_supplier(mysql, supplier_id):
     cursor.close()
 
 
-def get_inventory(mysql):
-    cursor = mysql.connection.cursor()
-    cursor.execute("""
-        SELECT Inventory.*, Products.product_name 
-        FROM Inventory
-        JOIN Products ON Inventory.product_id = Products.product_id
-    """)
-    items = cursor.fetchall()
-    cursor.close()
-    return items
+INVENTORY_LIST = {
+    'from': "Inventory JOIN Products ON Inventory.product_id = Products.product_id",
+    'select': "Inventory.*, Products.product_name",
+    'columns': {
+        'inventory_id': "Inventory.inventory_id",
+        'product_id': "Inventory.product_id",
+        'quantity': "Inventory.quantity",
+        'low_stock_threshold': "Inventory.low_stock_threshold",
+        'last_updated': "Inventory.last_updated",
+        'product_name': "Products.product_name",
+        'category': "Products.category",
+        'supplier_id': "Products.supplier_id",
+    },
+    'filters': {
+        'product_id': "Inventory.product_id",
+        'category': "Products.category",
+        'supplier_id': "Products.supplier_id",
+    },
+    'flags': {
+        'low_stock': "Inventory.quantity <= Inventory.low_stock_threshold",
+    },
+    'dates': {
+        'last_updated': "Inventory.last_updated",
+    },
+}
+
+def get_inventory(mysql, args=None):
+    return query_list(mysql, INVENTORY_LIST, args)
 
 def add_inventory(mysql, item):
     cursor = mysql.connection.cursor()
@@ -136,14 +300,36 @@ def delete_inventory(mysql, inventory_id):
     cursor.close()
 
 
-def get_transactions(mysql):
-    cursor = mysql.connection.cursor()
-    cursor.execute("""
-        SELECT * FROM Transactions
-    """)
-    txns = cursor.fetchall()
-    cursor.close()
-    return txns
+TRANSACTION_LIST = {
+    'from': "Transactions t JOIN Products p ON t.product_id = p.product_id",
+    'select': "t.transaction_id, t.product_id, p.product_name, t.user_id, "
+              "t.transaction_type, t.quantity_change, t.transaction_date",
+    'columns': {
+        'transaction_id': "t.transaction_id",
+        'product_id': "t.product_id",
+        'product_name': "p.product_name",
+        'user_id': "t.user_id",
+        'transaction_type': "t.transaction_type",
+        'quantity_change': "t.quantity_change",
+        'transaction_date': "t.transaction_date",
+        'category': "p.category",
+        'supplier_id': "p.supplier_id",
+    },
+    'filters': {
+        'product_id': "t.product_id",
+        'user_id': "t.user_id",
+        'transaction_type': "t.transaction_type",
+        'category': "p.category",
+        'supplier_id': "p.supplier_id",
+    },
+    'dates': {
+        'transaction_date': "t.transaction_date",
+    },
+    'order': "t.transaction_date DESC",
+}
+
+def get_transactions(mysql, args=None):
+    return query_list(mysql, TRANSACTION_LIST, args)
 
 def add_transaction(mysql, txn):
     cursor = mysql.connection.cursor()
@@ -165,32 +351,229 @@ def delete_transaction(mysql, transaction_id):
     mysql.connection.commit()
     cursor.close()
 
+def add_transactions(mysql, txns, idempotency=None):
+    # Insert a batch of transactions and apply their net quantity change to
+    # Inventory in a single commit (one UPDATE per product, not per row).
+    # Inventory rows are updated in product_id order so concurrent batches
+    # lock them in the same order and cannot deadlock each other.
+    # idempotency is a dict of user_id, endpoint, key, request_hash, status,
+    # body and ttl_hours: the key and the response are stored in the same
+    # commit. Returns False, writing nothing, if the key is already in use.
+    net_change = {}
+    for txn in txns:
+        net_change[txn['product_id']] = net_change.get(txn['product_id'], 0) + txn['quantity_change']
 
-def get_alerts(mysql):
+    cursor = mysql.connection.cursor()
+    try:
+        if idempotency is not None:
+            key = (idempotency['user_id'], idempotency['endpoint'], idempotency['key'])
+            # Insert first: deleting a missing key up front would take a gap
+            # lock and deadlock concurrent inserts into the same gap.
+            for attempt in range(2):
+                try:
+                    cursor.execute("""
+                        INSERT INTO IdempotencyKeys
+                            (user_id, endpoint, idempotency_key, request_hash, response_status, response_body)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, key + (idempotency['request_hash'], idempotency['status'], idempotency['body']))
+                    break
+                except IntegrityError:
+                    if attempt == 0:
+                        # The key exists, so this only locks that row. An
+                        # expired, not yet purged key is free to reuse.
+                        cursor.execute("""
+                            DELETE FROM IdempotencyKeys
+                            WHERE user_id=%s AND endpoint=%s AND idempotency_key=%s
+                              AND created_at < NOW() - INTERVAL %s HOUR
+                        """, key + (idempotency['ttl_hours'],))
+                        if cursor.rowcount == 1:
+                            continue
+                    mysql.connection.rollback()
+                    return False
+        cursor.executemany("""
+            INSERT INTO Transactions (product_id, user_id, transaction_type, quantity_change)
+            VALUES (%s, %s, %s, %s)
+        """, [
+            (txn['product_id'], txn['user_id'], txn['transaction_type'], txn['quantity_change'])
+            for txn in txns
+        ])
+        cursor.executemany("""
+            UPDATE Inventory
+            SET quantity = quantity + %s
+            WHERE product_id = %s
+        """, [(change, product_id) for product_id, change in sorted(net_change.items())])
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return True
+
+def init_idempotency_table(mysql):
     cursor = mysql.connection.cursor()
     cursor.execute("""
-        SELECT Alerts.*, Inventory.product_id 
-        FROM Alerts
-        JOIN Inventory ON Alerts.inventory_id = Inventory.inventory_id
+        CREATE TABLE IF NOT EXISTS IdempotencyKeys (
+            user_id INT NOT NULL,
+            endpoint VARCHAR(255) NOT NULL,
+            idempotency_key VARCHAR(255) NOT NULL,
+            request_hash CHAR(64) NOT NULL,
+            response_status INT NOT NULL,
+            response_body MEDIUMTEXT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, endpoint, idempotency_key),
+            INDEX idx_idempotency_created (created_at)
+        )
     """)
-    alerts = cursor.fetchall()
+    mysql.connection.commit()
     cursor.close()
-    return alerts
 
-def add_alert(mysql, alert):
+def get_idempotent_response(mysql, user_id, endpoint, key, ttl_hours):
+    # Returns (request_hash, status, body, seconds until the key expires),
+    # or None if the key is not stored (e.g. it was just purged).
     cursor = mysql.connection.cursor()
     cursor.execute("""
-        INSERT INTO Alerts (inventory_id, alert_type, message, is_active)
-        VALUES (%s, %s, %s, %s)
-    """, (
-        alert['inventory_id'],
-        alert['alert_type'],
-        alert['message'],
-        alert.get('is_active', True)
-    ))
+        SELECT request_hash, response_status, response_body,
+               TIMESTAMPDIFF(SECOND, NOW(), created_at + INTERVAL %s HOUR)
+        FROM IdempotencyKeys
+        WHERE user_id=%s AND endpoint=%s AND idempotency_key=%s
+    """, (ttl_hours, user_id, endpoint, key))
+    response = cursor.fetchone()
+    cursor.close()
+    return response
+
+def purge_idempotency_keys(mysql, ttl_hours):
+    cursor = mysql.connection.cursor()
+    cursor.execute(
+        "DELETE FROM IdempotencyKeys WHERE created_at < NOW() - INTERVAL %s HOUR",
+        (ttl_hours,)
+    )
+    mysql.connection.commit()
+    cursor.close()
+
+
+def init_barcode_table(mysql):
+    cursor = mysql.connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ProductBarcodes (
+            barcode VARCHAR(64) PRIMARY KEY,
+            product_id INT NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES Products(product_id) ON DELETE CASCADE
+        )
+    """)
+    # Single-row change counter, bumped in the same commit as every barcode
+    # write, so each worker's in-memory index can tell when it is stale.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS BarcodeIndexVersion (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO BarcodeIndexVersion (id, version) VALUES (1, 0)")
+    mysql.connection.commit()
+    cursor.close()
+
+def bump_barcode_version(cursor):
+    cursor.execute("UPDATE BarcodeIndexVersion SET version = version + 1 WHERE id = 1")
+
+def get_barcode_version(mysql):
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT version FROM BarcodeIndexVersion WHERE id = 1")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    return version
+
+def get_all_barcodes(mysql):
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT barcode, product_id FROM ProductBarcodes")
+    barcodes = cursor.fetchall()
+    cursor.close()
+    return barcodes
+
+def add_barcode(mysql, product_id, barcode):
+    cursor = mysql.connection.cursor()
+    cursor.execute("""
+        INSERT INTO ProductBarcodes (barcode, product_id)
+        VALUES (%s, %s)
+    """, (barcode, product_id))
+    bump_barcode_version(cursor)
     mysql.connection.commit()
     cursor.close()
 
+def delete_barcode(mysql, barcode):
+    cursor = mysql.connection.cursor()
+    cursor.execute("DELETE FROM ProductBarcodes WHERE barcode=%s", (barcode,))
+    bump_barcode_version(cursor)
+    mysql.connection.commit()
+    cursor.close()
+
+
+ALERT_LIST = {
+    'from': "Alerts a "
+            "JOIN Inventory i ON a.inventory_id = i.inventory_id "
+            "JOIN Products p ON i.product_id = p.product_id",
+    'select': "a.alert_id, a.inventory_id, i.product_id, p.product_name, "
+              "a.alert_type, a.message, a.is_active",
+    'columns': {
+        'alert_id': "a.alert_id",
+        'inventory_id': "a.inventory_id",
+        'product_id': "i.product_id",
+        'product_name': "p.product_name",
+        'alert_type': "a.alert_type",
+        'message': "a.message",
+        'is_active': "a.is_active",
+        'category': "p.category",
+        'supplier_id': "p.supplier_id",
+    },
+    'filters': {
+        'inventory_id': "a.inventory_id",
+        'product_id': "i.product_id",
+        'alert_type': "a.alert_type",
+        'category': "p.category",
+        'supplier_id': "p.supplier_id",
+    },
+    'booleans': {
+        'is_active': "a.is_active",
+    },
+    'flags': {
+        'low_stock': "i.quantity <= i.low_stock_threshold",
+    },
+    'order': "a.is_active DESC, a.alert_id DESC",
+}
+
+def get_alerts(mysql, args=None):
+    return query_list(mysql, ALERT_LIST, args)
+
+def add_alert(mysql, alert, recipients=()):
+    # The alert and its outbox rows are committed together, so a notification
+    # is only queued for an alert that exists; delete_alert drops the unsent
+    # ones.
+    cursor = mysql.connection.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO Alerts (inventory_id, alert_type, message, is_active)
+            VALUES (%s, %s, %s, %s)
+        """, (
+            alert['inventory_id'],
+            alert['alert_type'],
+            alert['message'],
+            alert.get('is_active', True)
+        ))
+        alert_id = cursor.lastrowid
+        if recipients:
+            subject = 'Inventory alert: %s (inventory #%s)' % (alert['alert_type'], alert['inventory_id'])
+            cursor.executemany("""
+                INSERT INTO AlertNotifications (alert_id, recipient, subject, body)
+                VALUES (%s, %s, %s, %s)
+            """, [(alert_id, recipient, subject, alert['message']) for recipient in recipients])
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return alert_id
+
 def update_alert(mysql, alert_id, alert):
     cursor = mysql.connection.cursor()
     cursor.execute("""
@@ -205,8 +588,103 @@ def update_alert(mysql, alert_id, alert):
     cursor.close()
 
 def delete_alert(mysql, alert_id):
+    # Unsent notifications go with the alert; sent ones are kept as history
+    cursor = mysql.connection.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM AlertNotifications WHERE alert_id=%s AND status='pending'",
+            (alert_id,)
+        )
+        cursor.execute("DELETE FROM Alerts WHERE alert_id=%s", (alert_id,))
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def init_notification_table(mysql):
+    cursor = mysql.connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AlertNotifications (
+            notification_id INT AUTO_INCREMENT PRIMARY KEY,
+            alert_id INT NOT NULL,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            status ENUM('pending', 'sent', 'failed') NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME NULL,
+            INDEX idx_notifications_due (status, next_attempt_at)
+        )
+    """)
+    mysql.connection.commit()
+    cursor.close()
+
+def claim_notifications(mysql, limit, digest_delay=0, lease_seconds=600):
+    # A recipient's due rows are only claimed once the oldest of them has
+    # waited digest_delay seconds, so a burst of alerts goes out as one digest.
+    # Claiming pushes next_attempt_at forward as a lease: other dispatchers
+    # skip the rows, and if this one dies they become due again later.
+    cursor = mysql.connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT n.notification_id, n.recipient, n.subject, n.body, n.attempts
+            FROM AlertNotifications n
+            JOIN (
+                SELECT recipient
+                FROM AlertNotifications
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                GROUP BY recipient
+                HAVING MIN(created_at) <= NOW() - INTERVAL %s SECOND
+            ) due ON due.recipient = n.recipient
+            WHERE n.status = 'pending' AND n.next_attempt_at <= NOW()
+            ORDER BY n.notification_id
+            LIMIT %s
+            FOR UPDATE OF n SKIP LOCKED
+        """, (digest_delay, limit))
+        rows = cursor.fetchall()
+        if rows:
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(
+                "UPDATE AlertNotifications SET next_attempt_at = NOW() + INTERVAL %s SECOND "
+                "WHERE notification_id IN (" + placeholders + ")",
+                (lease_seconds,) + tuple(row[0] for row in rows)
+            )
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return rows
+
+def mark_notifications_sent(mysql, notification_ids):
+    cursor = mysql.connection.cursor()
+    placeholders = ', '.join(['%s'] * len(notification_ids))
+    cursor.execute(
+        "UPDATE AlertNotifications SET status = 'sent', sent_at = NOW(), attempts = attempts + 1 "
+        "WHERE notification_id IN (" + placeholders + ")",
+        tuple(notification_ids)
+    )
+    mysql.connection.commit()
+    cursor.close()
+
+def retry_notifications(mysql, notification_ids, max_attempts, backoff_base):
+    # Exponential backoff: backoff_base, 2x, 4x, ... seconds; give up after max_attempts.
     cursor = mysql.connection.cursor()
-    cursor.execute("DELETE FROM Alerts WHERE alert_id=%s", (alert_id,))
+    placeholders = ', '.join(['%s'] * len(notification_ids))
+    cursor.execute(
+        "UPDATE AlertNotifications "
+        "SET attempts = attempts + 1, "
+        "    status = IF(attempts >= %s, 'failed', 'pending'), "
+        "    next_attempt_at = NOW() + INTERVAL (%s * POW(2, attempts - 1)) SECOND "
+        "WHERE notification_id IN (" + placeholders + ")",
+        (max_attempts, backoff_base) + tuple(notification_ids)
+    )
     mysql.connection.commit()
     cursor.close()
 
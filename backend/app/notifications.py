@@ -0,0 +1,124 @@
+# app/notifications.py
+
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from app.models import (
+    init_notification_table, claim_notifications, mark_notifications_sent, retry_notifications
+)
+
+
+def build_digest(recipient, rows):
+    # rows: (notification_id, recipient, subject, body, attempts)
+    message = EmailMessage()
+    message['To'] = recipient
+    if len(rows) == 1:
+        message['Subject'] = rows[0][2]
+        message.set_content(rows[0][3])
+    else:
+        message['Subject'] = '%d inventory alerts' % len(rows)
+        message.set_content('\n\n'.join('%s\n%s' % (row[2], row[3]) for row in rows))
+    return message
+
+
+class NotificationDispatcher:
+    """Drains the AlertNotifications outbox in the background.
+
+    A single poller thread claims due rows, groups them by recipient into one
+    digest each and hands the digests to a small worker pool for sending.
+    A recipient's rows are only claimed once the oldest has waited
+    digest_delay seconds, so a burst of alerts is coalesced. Failed sends go back to the outbox with
+    exponential backoff.
+    """
+
+    def __init__(self, app, mysql, workers=4, poll_interval=5, digest_delay=60,
+                 batch_size=100, max_attempts=5, backoff_base=30):
+        self.app = app
+        self.mysql = mysql
+        self.poll_interval = poll_interval
+        self.digest_delay = digest_delay
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='alert-notifications', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def notify(self):
+        # Called from the request path after an alert commit; never blocks.
+        self._wake.set()
+
+    def _run(self):
+        # The outbox table may not exist yet on a fresh database
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    init_notification_table(self.mysql)
+                break
+            except Exception as e:
+                self.app.logger.warning('Alert notification table unavailable: %s', e)
+                self._stop.wait(self.poll_interval)
+
+        while not self._stop.is_set():
+            # claim_notifications holds each recipient's rows back until the
+            # digest delay has passed, so a wake-up can drain straight away.
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.drain()
+            except Exception as e:
+                self.app.logger.warning('Alert notification drain failed: %s', e)
+
+    def drain(self):
+        with self.app.app_context():
+            rows = claim_notifications(self.mysql, self.batch_size, self.digest_delay)
+        if not rows:
+            return
+
+        digests = {}
+        for row in rows:
+            digests.setdefault(row[1], []).append(row)
+        futures = [
+            self._pool.submit(self._deliver, recipient, group)
+            for recipient, group in digests.items()
+        ]
+        for future in futures:
+            future.result()
+
+    def _deliver(self, recipient, rows):
+        ids = [row[0] for row in rows]
+        try:
+            self.send(build_digest(recipient, rows))
+        except Exception as e:
+            self.app.logger.warning('Sending alert digest to %s failed: %s', recipient, e)
+            with self.app.app_context():
+                retry_notifications(self.mysql, ids, self.max_attempts, self.backoff_base)
+            return
+        with self.app.app_context():
+            mark_notifications_sent(self.mysql, ids)
+
+    def send(self, message):
+        config = self.app.config
+        message['From'] = config['ALERT_EMAIL_FROM']
+        with smtplib.SMTP(config['SMTP_HOST'], config['SMTP_PORT'], timeout=10) as smtp:
+            if config.get('SMTP_USER'):
+                smtp.starttls()
+                smtp.login(config['SMTP_USER'], config['SMTP_PASSWORD'])
+            smtp.send_message(message)
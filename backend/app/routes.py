@@ -1,19 +1,49 @@
 from flask import request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from functools import wraps
+import atexit
+import hashlib
+import json
+import time
 
 from app import create_app, mysql, bcrypt
 from app.models import (
     get_all_products, create_product, update_product, delete_product,
     get_all_suppliers, create_supplier, update_supplier, delete_supplier,
     get_inventory, add_inventory, update_inventory, delete_inventory,
-    get_transactions, add_transaction, delete_transaction,
+    get_transactions, add_transaction, add_transactions, delete_transaction,
     get_alerts, add_alert, update_alert, delete_alert,
-    get_user_by_username, User  # Add these two
+    get_user_by_username, User,  # Add these two
+    init_barcode_table, get_barcode_version, get_all_barcodes, add_barcode, delete_barcode,
+    init_notification_table, init_idempotency_table, get_idempotent_response,
+    purge_idempotency_keys
 )
+from app.barcode_index import barcode_index
+from app.idempotency_cache import idempotency_cache
+from app.notifications import NotificationDispatcher
 
 app = create_app()
 
+notifier = NotificationDispatcher(app, mysql, digest_delay=app.config['ALERT_DIGEST_DELAY'])
+if app.config['SMTP_HOST']:
+    notifier.start()
+    # Let an in-flight send finish on shutdown instead of leaving its rows leased
+    atexit.register(notifier.stop)
+
+_tables_ready = False
+
+@app.before_request
+def prepare_tables():
+    # Create tables added after the original schema once per process, on the
+    # first request that needs the DB (not health checks or CORS preflights).
+    global _tables_ready
+    if _tables_ready or request.method == 'OPTIONS' or request.endpoint == 'health_check':
+        return
+    init_barcode_table(mysql)
+    init_notification_table(mysql)
+    init_idempotency_table(mysql)
+    _tables_ready = True
+
 @app.route('/health')
 def health_check():
     return {"status": "Backend running"}
@@ -28,7 +58,10 @@ from app.models import get_all_products, create_product, update_product, delete_
 
 @app.route('/products', methods=['GET'])
 def list_products():
-    products = get_all_products(mysql)
+    try:
+        products = get_all_products(mysql, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(products), 200
 
 @app.route('/products', methods=['POST'])
@@ -55,7 +88,10 @@ from app.models import get_all_suppliers, create_supplier, update_supplier, dele
 
 @app.route('/suppliers', methods=['GET'])
 def list_suppliers():
-    suppliers = get_all_suppliers(mysql)
+    try:
+        suppliers = get_all_suppliers(mysql, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(suppliers), 200
 
 @app.route('/suppliers', methods=['POST'])
@@ -80,7 +116,10 @@ from app.models import get_inventory, add_inventory, update_inventory, delete_in
 
 @app.route('/inventory', methods=['GET'])
 def list_inventory():
-    items = get_inventory(mysql)
+    try:
+        items = get_inventory(mysql, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(items), 200
 
 @app.route('/inventory', methods=['POST'])
@@ -107,59 +146,122 @@ def remove_inventory_item(inventory_id):
 
 
 from app.models import get_transactions, add_transaction, delete_transaction
+from app.models import get_transactions as list_transactions
 
 # GET all transactions
 @app.route('/transactions', methods=['GET'])
 @login_required
 def get_transactions():
     try:
-        cursor = mysql.connection.cursor()
-        cursor.execute("""
-            SELECT t.transaction_id, t.product_id, p.product_name, t.user_id, t.transaction_type, t.quantity_change, t.transaction_date
-            FROM Transactions t
-            JOIN Products p ON t.product_id = p.product_id
-            ORDER BY t.transaction_date DESC
-        """)
-        transactions = cursor.fetchall()
-        cursor.close()
+        transactions = list_transactions(mysql, request.args)
         return jsonify(transactions), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Idempotency-Key support for transaction writes: a retried request with the
+# same key gets the original response back instead of writing again. Keys are
+# scoped to the user and endpoint, and reusing one with a different body is
+# rejected with 422. Keys expire after IDEMPOTENCY_KEY_TTL_HOURS.
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+KEY_PURGE_INTERVAL = 600
+_last_key_purge = 0.0
+
+def request_idempotency_key():
+    key = request.headers.get('Idempotency-Key')
+    return (current_user.id, request.method + ' ' + request.path, key) if key else None
+
+def request_hash():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+def mismatched_key_response():
+    return jsonify({'error': 'Idempotency-Key was already used with a different request'}), 422
+
+def purge_expired_keys():
+    # At most once per KEY_PURGE_INTERVAL seconds per process
+    global _last_key_purge
+    now = time.monotonic()
+    if now - _last_key_purge < KEY_PURGE_INTERVAL:
+        return
+    _last_key_purge = now
+    purge_idempotency_keys(mysql, app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+
+def idempotent_response(status, body, replayed=False):
+    response = app.response_class(body, status=status, mimetype='application/json')
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def replay_idempotent_request():
+    key = request_idempotency_key()
+    if key and len(key[2]) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return jsonify({'error': 'Idempotency-Key must be at most %d characters' % MAX_IDEMPOTENCY_KEY_LENGTH}), 400
+    cached = idempotency_cache.get(key) if key else None
+    if cached is None:
+        return None
+    stored_hash, status, body = cached
+    if stored_hash != request_hash():
+        return mismatched_key_response()
+    return idempotent_response(status, body, replayed=True)
+
+def record_transactions(txns, payload, status):
+    key = request_idempotency_key()
+    if key is None:
+        add_transactions(mysql, txns)
+        return jsonify(payload), status
+
+    purge_expired_keys()
+    ttl_hours = app.config['IDEMPOTENCY_KEY_TTL_HOURS']
+    body = json.dumps(payload)
+    this_hash = request_hash()
+    # Two attempts: the stored row can be purged between a failed key
+    # insert and the read, in which case the write is simply retried.
+    for attempt in range(2):
+        if add_transactions(mysql, txns, idempotency={
+            'user_id': key[0],
+            'endpoint': key[1],
+            'key': key[2],
+            'request_hash': this_hash,
+            'status': status,
+            'body': body,
+            'ttl_hours': ttl_hours
+        }):
+            idempotency_cache.put(key, (this_hash, status, body), ttl_hours * 3600)
+            return idempotent_response(status, body)
+
+        stored = get_idempotent_response(mysql, key[0], key[1], key[2], ttl_hours)
+        if stored is not None:
+            stored_hash, stored_status, stored_body, expires_in = stored
+            idempotency_cache.put(key, (stored_hash, stored_status, stored_body), expires_in)
+            if stored_hash != this_hash:
+                return mismatched_key_response()
+            return idempotent_response(stored_status, stored_body, replayed=True)
+
+    return jsonify({'error': 'Idempotency-Key is in use, retry the request'}), 409
+
 # POST create new transaction
 # POST create new transaction and update inventory
 @app.route('/transactions', methods=['POST'])
 @login_required
 def add_transaction():
     try:
+        replayed = replay_idempotent_request()
+        if replayed is not None:
+            return replayed
+
         data = request.get_json()
-        product_id = data['product_id']
-        user_id = data['user_id']
-        transaction_type = data['transaction_type']
-        quantity_change = data['quantity_change']
 
-        cursor = mysql.connection.cursor()
-        
-        # Insert the transaction
-        cursor.execute("""
-            INSERT INTO Transactions (product_id, user_id, transaction_type, quantity_change)
-            VALUES (%s, %s, %s, %s)
-        """, (product_id, user_id, transaction_type, quantity_change))
-        
-        # Update the inventory quantity
-        cursor.execute("""
-            UPDATE Inventory 
-            SET quantity = quantity + %s 
-            WHERE product_id = %s
-        """, (quantity_change, product_id))
-        
-        mysql.connection.commit()
-        cursor.close()
-        
-        return jsonify({'message': 'Transaction recorded and inventory updated successfully'}), 201
+        # Insert the transaction and update the inventory quantity
+        return record_transactions([{
+            'product_id': data['product_id'],
+            'user_id': data['user_id'],
+            'transaction_type': data['transaction_type'],
+            'quantity_change': data['quantity_change']
+        }], {'message': 'Transaction recorded and inventory updated successfully'}, 201)
         
     except Exception as e:
-        mysql.connection.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -169,25 +271,119 @@ def remove_transaction(transaction_id):
     return jsonify({'message': 'Transaction deleted'}), 200
 
 
+# Barcodes and scanning
+
+def resolve_barcodes(barcodes):
+    # One primary-key read of the barcode version per request; the index is
+    # reloaded only when a barcode was added, removed or reassigned (by any
+    # worker process) since it was last loaded.
+    version = get_barcode_version(mysql)
+    if version != barcode_index.version:
+        barcode_index.load(get_all_barcodes(mysql), version)
+
+    resolved = {}
+    for barcode in barcodes:
+        product_id = barcode_index.get(barcode)
+        if product_id is not None:
+            resolved[barcode] = product_id
+    return resolved
+
+def scan_to_transaction(scan, product_id):
+    # Scans are always recorded as the logged-in user
+    return {
+        'product_id': product_id,
+        'user_id': current_user.id,
+        'transaction_type': scan.get('transaction_type', 'sale'),
+        'quantity_change': scan.get('quantity_change', -1)
+    }
+
+@app.route('/products/<int:product_id>/barcodes', methods=['POST'])
+@login_required
+def add_product_barcode(product_id):
+    try:
+        barcode = request.get_json()['barcode']
+        add_barcode(mysql, product_id, barcode)
+        return jsonify({'message': 'Barcode added successfully'}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/barcodes/<barcode>', methods=['DELETE'])
+@login_required
+def remove_barcode(barcode):
+    try:
+        delete_barcode(mysql, barcode)
+        return jsonify({'message': 'Barcode deleted successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# POST a single scan: resolve the barcode and record it as a transaction
+@app.route('/scan', methods=['POST'])
+@login_required
+def scan():
+    try:
+        replayed = replay_idempotent_request()
+        if replayed is not None:
+            return replayed
+
+        data = request.get_json()
+        barcode = data['barcode']
+        product_id = resolve_barcodes([barcode]).get(barcode)
+        if product_id is None:
+            return jsonify({'error': 'Unknown barcode', 'barcode': barcode}), 404
+
+        return record_transactions(
+            [scan_to_transaction(data, product_id)],
+            {'message': 'Scan recorded', 'product_id': product_id},
+            201
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# POST a burst of scans: {"scans": [{"barcode": ..., ...}, ...]}
+# Known barcodes are recorded in one commit; unknown ones are reported back.
+@app.route('/scan/batch', methods=['POST'])
+@login_required
+def scan_batch():
+    try:
+        replayed = replay_idempotent_request()
+        if replayed is not None:
+            return replayed
+
+        scans = request.get_json()['scans']
+        resolved = resolve_barcodes([s['barcode'] for s in scans])
+
+        txns = []
+        unknown = []
+        for s in scans:
+            product_id = resolved.get(s['barcode'])
+            if product_id is None:
+                unknown.append(s['barcode'])
+            else:
+                txns.append(scan_to_transaction(s, product_id))
+
+        return record_transactions(txns, {
+            'message': 'Scans recorded',
+            'recorded': len(txns),
+            'unknown': unknown
+        }, 201)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 from app.models import get_alerts, add_alert, update_alert, delete_alert
+from app.models import add_alert as add_alert_with_notifications
+from app.models import get_alerts as list_alerts
+from app.models import delete_alert as delete_alert_and_notifications
 
 # GET all alerts
 @app.route('/alerts', methods=['GET'])
 @login_required
 def get_alerts():
     try:
-        cursor = mysql.connection.cursor()
-        cursor.execute("""
-            SELECT a.alert_id, a.inventory_id, i.product_id, p.product_name, 
-                   a.alert_type, a.message, a.is_active
-            FROM Alerts a
-            JOIN Inventory i ON a.inventory_id = i.inventory_id
-            JOIN Products p ON i.product_id = p.product_id
-            ORDER BY a.is_active DESC, a.alert_id DESC
-        """)
-        alerts = cursor.fetchall()
-        cursor.close()
+        alerts = list_alerts(mysql, request.args)
         return jsonify(alerts), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -197,18 +393,17 @@ def get_alerts():
 def add_alert():
     try:
         data = request.get_json()
-        inventory_id = data['inventory_id']
-        alert_type = data['alert_type']
-        message = data['message']
-        is_active = data.get('is_active', True)
-
-        cursor = mysql.connection.cursor()
-        cursor.execute("""
-            INSERT INTO Alerts (inventory_id, alert_type, message, is_active)
-            VALUES (%s, %s, %s, %s)
-        """, (inventory_id, alert_type, message, is_active))
-        mysql.connection.commit()
-        cursor.close()
+        alert = {
+            'inventory_id': data['inventory_id'],
+            'alert_type': data['alert_type'],
+            'message': data['message'],
+            'is_active': data.get('is_active', True)
+        }
+
+        # Outbox rows are written with the alert; the dispatcher sends them later
+        recipients = app.config['ALERT_EMAIL_TO'] if app.config['SMTP_HOST'] else ()
+        add_alert_with_notifications(mysql, alert, recipients)
+        notifier.notify()
         
         return jsonify({'message': 'Alert created successfully'}), 201
     except Exception as e:
@@ -250,10 +445,7 @@ def update_alert(alert_id):
 @login_required
 def delete_alert(alert_id):
     try:
-        cursor = mysql.connection.cursor()
-        cursor.execute("DELETE FROM Alerts WHERE alert_id = %s", (alert_id,))
-        mysql.connection.commit()
-        cursor.close()
+        delete_alert_and_notifications(mysql, alert_id)
         
         return jsonify({'message': 'Alert deleted successfully'}), 200
     except Exception as e:
@@ -0,0 +1 @@
+# Lets pytest, run from backend/, import the `app` package.
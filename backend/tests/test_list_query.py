@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from app.models import (
+    build_list_query, ALERT_LIST, INVENTORY_LIST, PRODUCT_LIST, TRANSACTION_LIST
+)
+
+
+def test_defaults_match_original_queries():
+    assert build_list_query(PRODUCT_LIST, {}) == ("SELECT * FROM Products", ())
+    sql, params = build_list_query(ALERT_LIST, {})
+    assert sql.endswith("ORDER BY a.is_active DESC, a.alert_id DESC")
+    assert params == ()
+
+
+@pytest.mark.parametrize('args', [
+    {'fields': 'product_id,password_hash'},
+    {'fields': 'price FROM Users --'},
+    {'sort': 'price;DROP TABLE Products'},
+    {'sort': '-unknown'},
+])
+def test_unknown_fields_and_sort_are_rejected(args):
+    with pytest.raises(ValueError):
+        build_list_query(PRODUCT_LIST, args)
+
+
+def test_fields_project_in_requested_order():
+    sql, _ = build_list_query(PRODUCT_LIST, {'fields': 'price, product_id'})
+    assert sql == "SELECT price, product_id FROM Products"
+
+
+def test_leading_dash_sorts_descending():
+    sql, _ = build_list_query(PRODUCT_LIST, {'sort': '-price,product_name'})
+    assert sql.endswith("ORDER BY price DESC, product_name ASC")
+
+
+def test_date_only_to_is_next_midnight_exclusive():
+    sql, params = build_list_query(TRANSACTION_LIST, {'transaction_date_to': '2024-01-31'})
+    assert "t.transaction_date < %s" in sql
+    assert params == (datetime(2024, 2, 1),)
+
+
+def test_datetime_to_is_inclusive():
+    sql, params = build_list_query(TRANSACTION_LIST, {'transaction_date_to': '2024-01-31T12:30'})
+    assert "t.transaction_date <= %s" in sql
+    assert params == (datetime(2024, 1, 31, 12, 30),)
+
+
+@pytest.mark.parametrize('value', ['2024-W01-1', '20240101', '2024-01-01T00:00:00Z', 'yesterday'])
+def test_unsupported_date_formats_are_rejected(value):
+    with pytest.raises(ValueError):
+        build_list_query(TRANSACTION_LIST, {'transaction_date_from': value})
+
+
+def test_low_stock_false_negates_condition():
+    sql, params = build_list_query(INVENTORY_LIST, {'low_stock': 'false'})
+    assert "WHERE NOT (Inventory.quantity <= Inventory.low_stock_threshold)" in sql
+    assert params == ()
+
+
+def test_invalid_boolean_is_rejected():
+    with pytest.raises(ValueError):
+        build_list_query(ALERT_LIST, {'is_active': 'maybe'})
+
+
+def test_values_are_bound_never_interpolated():
+    hostile = "x' OR '1'='1"
+    args = {
+        'category': hostile,
+        'supplier_id': hostile + '2',
+        'product_id': hostile + '3',
+        'is_active': 'true',
+    }
+    sql, params = build_list_query(ALERT_LIST, args)
+    for value in (hostile, hostile + '2', hostile + '3'):
+        assert value in params
+    assert True in params
+    assert "'" not in sql
+    assert sql.count("%s") == len(params)
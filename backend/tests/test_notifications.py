@@ -0,0 +1,110 @@
+import socket
+
+import pytest
+from flask import Flask
+
+import app.notifications as notifications
+from app.notifications import NotificationDispatcher, build_digest
+
+
+def make_dispatcher(smtp_port=25):
+    flask_app = Flask(__name__)
+    flask_app.config.update(
+        SMTP_HOST='127.0.0.1',
+        SMTP_PORT=smtp_port,
+        SMTP_USER=None,
+        SMTP_PASSWORD=None,
+        ALERT_EMAIL_FROM='inventory@localhost',
+    )
+    return NotificationDispatcher(flask_app, mysql=None, workers=2, max_attempts=3, backoff_base=10)
+
+
+def row(notification_id, recipient, subject='Inventory alert: low_stock', body='Stock low'):
+    return (notification_id, recipient, subject, body, 0)
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    calls = {'claimed': [], 'sent': [], 'retried': []}
+
+    def claim(mysql, limit, digest_delay=0):
+        rows, calls['claimed'] = calls['claimed'], []
+        return rows
+
+    monkeypatch.setattr(notifications, 'claim_notifications', claim)
+    monkeypatch.setattr(notifications, 'mark_notifications_sent',
+                        lambda mysql, ids: calls['sent'].append(sorted(ids)))
+    monkeypatch.setattr(notifications, 'retry_notifications',
+                        lambda mysql, ids, max_attempts, backoff_base:
+                        calls['retried'].append((sorted(ids), max_attempts, backoff_base)))
+    return calls
+
+
+def test_build_digest_merges_rows():
+    message = build_digest('a@example.com', [row(1, 'a@example.com', body='one'),
+                                             row(2, 'a@example.com', body='two')])
+    assert message['To'] == 'a@example.com'
+    assert message['Subject'] == '2 inventory alerts'
+    assert 'one' in message.get_content() and 'two' in message.get_content()
+
+
+def test_drain_sends_one_digest_per_recipient(outbox):
+    dispatcher = make_dispatcher()
+    sent = []
+    dispatcher.send = sent.append
+    outbox['claimed'] = [row(1, 'a@example.com'), row(2, 'a@example.com'),
+                         row(3, 'a@example.com'), row(4, 'b@example.com')]
+
+    dispatcher.drain()
+    dispatcher.stop()
+
+    assert sorted(message['To'] for message in sent) == ['a@example.com', 'b@example.com']
+    assert sorted(outbox['sent']) == [[1, 2, 3], [4]]
+    assert outbox['retried'] == []
+
+
+def test_failed_send_is_rescheduled(outbox):
+    dispatcher = make_dispatcher()
+
+    def fail(message):
+        raise OSError('connection refused')
+
+    dispatcher.send = fail
+    outbox['claimed'] = [row(1, 'a@example.com'), row(2, 'a@example.com')]
+
+    dispatcher.drain()
+    dispatcher.stop()
+
+    assert outbox['sent'] == []
+    assert outbox['retried'] == [([1, 2], 3, 10)]
+
+
+def test_send_through_local_smtp():
+    controller_module = pytest.importorskip('aiosmtpd.controller')
+
+    class Handler:
+        def __init__(self):
+            self.envelopes = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.envelopes.append(envelope)
+            return '250 OK'
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    handler = Handler()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        dispatcher = make_dispatcher(smtp_port=port)
+        dispatcher.send(build_digest('a@example.com', [row(1, 'a@example.com'),
+                                                       row(2, 'a@example.com')]))
+        dispatcher.stop()
+    finally:
+        controller.stop()
+
+    assert len(handler.envelopes) == 1
+    assert handler.envelopes[0].rcpt_tos == ['a@example.com']
+    assert b'Subject: 2 inventory alerts' in handler.envelopes[0].content
@@ -19,34 +19,34 @@ export const authAPI = {
 };
 
 export const productsAPI = {
-  getAll: () => api.get('/products'),
+  getAll: (params) => api.get('/products', { params }),
   create: (product) => api.post('/products', product),
   update: (id, product) => api.put(`/products/${id}`, product),
   delete: (id) => api.delete(`/products/${id}`),
 };
 
 export const suppliersAPI = {
-  getAll: () => api.get('/suppliers'),
+  getAll: (params) => api.get('/suppliers', { params }),
   create: (supplier) => api.post('/suppliers', supplier),
   update: (id, supplier) => api.put(`/suppliers/${id}`, supplier),
   delete: (id) => api.delete(`/suppliers/${id}`),
 };
 
 export const inventoryAPI = {
-  getAll: () => api.get('/inventory'),
+  getAll: (params) => api.get('/inventory', { params }),
   create: (inventory) => api.post('/inventory', inventory),
   update: (id, inventory) => api.put(`/inventory/${id}`, inventory),
   delete: (id) => api.delete(`/inventory/${id}`),
 };
 
 export const transactionsAPI = {
-  getAll: () => api.get('/transactions'),
+  getAll: (params) => api.get('/transactions', { params }),
   create: (transaction) => api.post('/transactions', transaction),
   delete: (id) => api.delete(`/transactions/${id}`),
 };
 
 export const alertsAPI = {
-  getAll: () => api.get('/alerts'),
+  getAll: (params) => api.get('/alerts', { params }),
   create: (alert) => api.post('/alerts', alert),
   update: (id, alert) => api.put(`/alerts/${id}`, alert),
   delete: (id) => api.delete(`/alerts/${id}`),
@@ -60,6 +60,13 @@ export const dashboardAPI = {
   getCategoryDistribution: () => api.get('/dashboard/category-distribution'),
 };
 
+export const scanAPI = {
+  addBarcode: (productId, barcode) => api.post(`/products/${productId}/barcodes`, { barcode }),
+  deleteBarcode: (barcode) => api.delete(`/barcodes/${encodeURIComponent(barcode)}`),
+  scan: (scan) => api.post('/scan', scan),
+  scanBatch: (scans) => api.post('/scan/batch', { scans }),
+};
+
 
 
 export default api;